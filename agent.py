@@ -0,0 +1,151 @@
+import argparse
+import hmac
+import os
+
+from flask import Flask, request, jsonify, send_file, abort
+
+import executor
+from pool import WarmPool, parse_pool_spec
+
+app = Flask(__name__)
+
+# capacidade anunciada; pode ser reduzida via --cpu/--memory para simular
+# vários hosts menores com vários agentes no mesmo localhost
+_capacity = executor.host_capacity()
+_node_id = "node"
+_pool = WarmPool({})
+
+# segredo compartilhado com a API (EXECENV_AGENT_TOKEN nos dois lados);
+# vazio = sem autenticação, só aceitável com --host 127.0.0.1
+_token = os.environ.get("EXECENV_AGENT_TOKEN", "")
+
+
+def _plain_namespace(namespace):
+    """
+    Namespace vira caminho em environments/<ns> e o agente roda como root:
+    só aceitamos um nome simples (sem "/", "..", ou começando com ".",
+    que é onde fica o .pool).
+    """
+    return (
+        isinstance(namespace, str)
+        and namespace != ""
+        and not namespace.startswith(".")
+        and "/" not in namespace
+        and "\\" not in namespace
+        and ".." not in namespace
+        and "\0" not in namespace
+    )
+
+
+@app.before_request
+def _check_token():
+    sent = request.headers.get("X-Agent-Token", "")
+    if _token and not hmac.compare_digest(sent, _token):
+        abort(401)
+
+
+@app.route('/capacity', methods=['GET'])
+def capacity():
+    return jsonify({'node': _node_id, **_capacity})
+
+
+@app.route('/run', methods=['POST'])
+def run():
+    data = request.json
+    if not _plain_namespace(data.get('namespace')):
+        return jsonify({'error': 'Namespace inválido'}), 400
+    args = (
+        data['namespace'],
+        data.get('command', ''),
+        float(data.get('cpu', 1.0)),
+        int(data.get('memory', 512)),
+        int(data.get('io', 1)),
+    )
+    # slot quente do pool quando houver; senão, caminho frio
+    unit_name, main_pid, path = _pool.claim(*args) or executor.run_command(*args)
+    return jsonify({'unit': unit_name, 'pid': main_pid, 'output_path': path}), 202
+
+
+@app.route('/pool', methods=['GET'])
+def pool():
+    return jsonify(_pool.status())
+
+
+@app.route('/pressure', methods=['GET'])
+def pressure():
+    return jsonify(executor.host_pressure())
+
+
+@app.route('/resize', methods=['POST'])
+def resize():
+    data = request.json
+    ok = executor.resize_unit(
+        data['namespace'],
+        data['unit'],
+        float(data['cpu']),
+        int(data['memory']),
+        data.get('io'),
+    )
+    return jsonify({'ok': ok})
+
+
+@app.route('/units/<unit_name>', methods=['GET'])
+def unit_props(unit_name):
+    return jsonify(executor.systemd_props(unit_name))
+
+
+@app.route('/sample/<int:pid>', methods=['GET'])
+def sample(pid):
+    return jsonify(executor.sample_process(pid, request.args.get('unit')))
+
+
+@app.route('/kill', methods=['POST'])
+def kill():
+    data = request.json
+    executor.kill_unit(data.get('unit'), data.get('pid'))
+    return jsonify({'message': 'ok'})
+
+
+@app.route('/cleanup', methods=['POST'])
+def cleanup():
+    data = request.json
+    if not _plain_namespace(data.get('namespace')):
+        return jsonify({'error': 'Namespace inválido'}), 400
+    executor.remove_env_dir(data['namespace'])
+    return jsonify({'message': 'ok'})
+
+
+@app.route('/output/<namespace>', methods=['GET'])
+def output(namespace):
+    if not _plain_namespace(namespace):
+        return jsonify({'error': 'Namespace inválido'}), 400
+    path = os.path.abspath(os.path.join("environments", namespace, "output.log"))
+    try:
+        return send_file(path, mimetype='text/plain')
+    except FileNotFoundError:
+        return jsonify({'error': 'Arquivo de output não encontrado'}), 404
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Agente de nó do ExecManager')
+    parser.add_argument('--node-id', default=os.uname().nodename)
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='use 0.0.0.0 só junto com EXECENV_AGENT_TOKEN')
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--cpu', type=float, help='vCPUs anunciadas (padrão: do host)')
+    parser.add_argument('--memory', type=int, help='memória anunciada em MB (padrão: do host)')
+    parser.add_argument('--io', type=int, help='orçamento de níveis de io anunciado (padrão: EXECENV_IO_CAPACITY)')
+    parser.add_argument('--warm-pool', default=os.environ.get('EXECENV_WARM_POOL', ''),
+                        help='perfis do pool quente, ex: "1.0:512=2,0.5:256=4"')
+    args = parser.parse_args()
+
+    _node_id = args.node_id
+    if args.cpu:
+        _capacity['cpu'] = args.cpu
+    if args.memory:
+        _capacity['memory'] = args.memory
+    if args.io is not None:
+        _capacity['io'] = args.io
+    _pool = WarmPool(parse_pool_spec(args.warm_pool), _node_id)
+
+    app.run(host=args.host, port=args.port)
@@ -1,9 +1,108 @@
-from flask import Flask, request, jsonify, send_file
+import gzip
+import hashlib
+import time
+
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
 from manager import manager
 
 app = Flask(__name__)
-CORS(app)
+# o dashboard lê a versão para pedir só o que mudou (?since=)
+CORS(app, expose_headers=['ETag', 'X-Env-Version'])
+
+# respostas menores que isso não compensam o gzip
+GZIP_MIN_SIZE = 1024
+# bloco usado para repassar o output.log de um nó remoto
+OUTPUT_CHUNK = 64 * 1024
+_GZIP_CACHE_MAX = 16
+_gzip_cache = {}        # etag -> corpo comprimido
+_env_body_cache = None  # (versão, corpo JSON de /environments)
+# /resources traz PSI ao vivo (muda a cada poucos segundos): o corpo fica em
+# cache por versão e por RESOURCES_TTL segundos, então polls dentro da janela
+# não refazem a consulta aos nós nem a leitura de /proc/pressure
+RESOURCES_TTL = 2.0
+_resources_cache = None  # (versão, instante, corpo, etag)
+
+
+def _json_response(etag, make_body):
+    """
+    Resposta JSON condicional:
+      - If-None-Match com o mesmo ETag -> 304 sem chamar make_body
+        (quando o ETag vem da versão, nem toca no banco)
+      - etag=None -> ETag é o hash do corpo (economiza só banda)
+      - gzip se o cliente aceitar e o corpo for grande
+    """
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        resp = Response(status=304)
+        resp.set_etag(etag, weak=True)
+        return resp
+
+    body = make_body()
+    if etag is None:
+        etag = hashlib.sha1(body).hexdigest()
+        if request.if_none_match.contains_weak(etag):
+            resp = Response(status=304)
+            resp.set_etag(etag, weak=True)
+            return resp
+
+    resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag, weak=True)
+    resp.vary.add('Accept-Encoding')
+    if len(body) >= GZIP_MIN_SIZE and request.accept_encodings['gzip']:
+        gz = _gzip_cache.get(etag)
+        if gz is None:
+            gz = gzip.compress(body, compresslevel=5)
+            if len(_gzip_cache) >= _GZIP_CACHE_MAX:
+                _gzip_cache.clear()
+            _gzip_cache[etag] = gz
+        resp.set_data(gz)
+        resp.headers['Content-Encoding'] = 'gzip'
+    return resp
+
+
+def _dumps(obj):
+    return app.json.dumps(obj).encode()
+
+
+def _environments_body(version):
+    """Corpo completo de /environments, serializado uma vez por versão."""
+    global _env_body_cache
+    if _env_body_cache and _env_body_cache[0] == version:
+        return _env_body_cache[1]
+    body = _dumps(manager.list_environments())
+    _env_body_cache = (version, body)
+    return body
+
+
+def _resources_body():
+    """Corpo de /resources e seu ETag, refeitos só se a versão mudou ou o TTL venceu."""
+    global _resources_cache
+    version = manager.version
+    now = time.monotonic()
+    if (
+        _resources_cache
+        and _resources_cache[0] == version
+        and now - _resources_cache[1] < RESOURCES_TTL
+    ):
+        return _resources_cache[2], _resources_cache[3]
+    body = _dumps(manager.get_available_resources())
+    etag = hashlib.sha1(body).hexdigest()
+    _resources_cache = (version, now, body, etag)
+    return body, etag
+
+
+def _stream_output(res):
+    """Repassa a resposta do agente em blocos, sem bufferizar o log."""
+    try:
+        while True:
+            chunk = res.read(OUTPUT_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+    except OSError:
+        pass
+    finally:
+        res.close()
 
 @app.route('/')
 def home():
@@ -13,7 +112,9 @@ def home():
         <li><strong>POST /create</strong> — Criar novo ambiente</li>
         <li><strong>POST /execute</strong> — Executar programa</li>
         <li><strong>GET /status/&lt;namespace&gt;</strong> — Status (pid, mem, cpu, status, command)</li>
-        <li><strong>GET /environments</strong> — Listar ambientes (persistidos)</li>
+        <li><strong>GET /environments</strong> — Listar ambientes (persistidos; ETag/304, <code>?since=&lt;versão&gt;</code> para só o que mudou)</li>
+        <li><strong>PATCH /environments/&lt;namespace&gt;</strong> — Alterar CPU/memória (ao vivo se rodando)</li>
+        <li><strong>GET /environments/&lt;namespace&gt;/recommendation</strong> — Limites sugeridos pelo histórico</li>
         <li><strong>GET /output/&lt;namespace&gt;</strong> — Ver output</li>
         <li><strong>DELETE /terminate/&lt;namespace&gt;</strong> — Encerrar</li>
     </ul>
@@ -37,15 +138,42 @@ def status(namespace):
 
 @app.route('/environments', methods=['GET'])
 def list_envs():
-    return jsonify(manager.list_environments())
+    version = manager.version
+    since = request.args.get('since', type=int)
+    if since is not None:
+        # {"version", "full", "rows"}: só linhas com status/métricas novas
+        resp = _json_response(
+            None, lambda: _dumps(manager.list_environments_since(since))
+        )
+    else:
+        resp = _json_response(f'env-{version}', lambda: _environments_body(version))
+    resp.headers['X-Env-Version'] = str(version)
+    return resp
+
+@app.route('/environments/<namespace>', methods=['PATCH'])
+def resize_env(namespace):
+    data = request.json or {}
+    result = manager.resize_environment(namespace, data)
+    return jsonify(result), 200 if 'error' not in result else 400
+
+@app.route('/environments/<namespace>/recommendation', methods=['GET'])
+def recommendation(namespace):
+    result = manager.get_recommendation(namespace)
+    return jsonify(result), 200 if 'error' not in result else 404
 
 @app.route('/output/<namespace>', methods=['GET'])
 def output(namespace):
-    path = manager.get_output_path(namespace)
-    try:
-        return send_file(path, mimetype='text/plain')
-    except FileNotFoundError:
+    # o log fica no nó que executou o ambiente
+    source = manager.get_output(namespace)
+    if source is None:
         return jsonify({'error': 'Arquivo de output não encontrado'}), 404
+    if isinstance(source, str):
+        try:
+            return send_file(source, mimetype='text/plain')
+        except FileNotFoundError:
+            return jsonify({'error': 'Arquivo de output não encontrado'}), 404
+    return Response(_stream_output(source), mimetype='text/plain')
+
 
 @app.route('/terminate/<namespace>', methods=['DELETE'])
 def terminate(namespace):
@@ -54,7 +182,8 @@ def terminate(namespace):
 
 @app.route('/resources', methods=['GET'])
 def resources():
-    return jsonify(manager.get_available_resources())
+    body, etag = _resources_body()
+    return _json_response(etag, lambda: body)
 
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -1,10 +1,34 @@
 import subprocess
 import os
+import shutil
+import signal
 import time
 import math
+import psutil
 
 CGROUP_ROOT = "/sys/fs/cgroup"
 PROJECT_CGROUP_PARENT = os.path.join(CGROUP_ROOT, "exec_env")
+# onde o systemd coloca as units transitórias do systemd-run
+SYSTEM_SLICE = os.path.join(CGROUP_ROOT, "system.slice")
+
+# ----- IO -----
+# O campo "io" (1..10 no slider) vira:
+#   IOWeight = io * 100          (peso proporcional; 100 é o padrão do kernel)
+#   IOReadBandwidthMax/IOWriteBandwidthMax = io * EXECENV_IO_MBPS_PER_LEVEL MB/s
+#     no disco EXECENV_IO_DEVICE (só se os dois estiverem configurados)
+# EXECENV_IO_CAPACITY é o orçamento de "níveis de io" do nó para admissão
+# (soma dos io dos ambientes rodando); 0 desliga a contabilidade.
+IO_DEVICE = os.environ.get("EXECENV_IO_DEVICE", "")
+IO_MBPS_PER_LEVEL = int(os.environ.get("EXECENV_IO_MBPS_PER_LEVEL", "0"))
+IO_CAPACITY = int(os.environ.get("EXECENV_IO_CAPACITY", "0"))
+
+# última leitura de io.stat por unit, para calcular vazão entre amostras
+_last_io = {}
+
+# Pressure Stall Information (PSI): % do tempo em que tarefas ficaram
+# esperando cpu/memória/io. Host em /proc/pressure, unit em <cgroup>/*.pressure
+PSI_RESOURCES = ("cpu", "memory", "io")
+HOST_PRESSURE_DIR = "/proc/pressure"
 
 
 def _sudo_sh(cmd: str):
@@ -24,33 +48,60 @@ def _sudo_sh(cmd: str):
 
 def _ensure_parent_cgroup():
     """
-    Garante que /sys/fs/cgroup/exec_env existe e habilita cpu/memory
+    Garante que /sys/fs/cgroup/exec_env existe e habilita cpu/memory/io
     tanto na raiz quanto no próprio /sys/fs/cgroup/exec_env, para que
     OS FILHOS (ex: /sys/fs/cgroup/exec_env/<namespace>) herdem
-    cpu.max e memory.max.
+    cpu.max, memory.max, io.weight e io.max.
 
     Passos equivalentes manualmente:
       sudo mkdir -p /sys/fs/cgroup/exec_env
-      echo +cpu +memory > /sys/fs/cgroup/cgroup.subtree_control
-      echo +cpu +memory > /sys/fs/cgroup/exec_env/cgroup.subtree_control
+      echo +cpu +memory +io > /sys/fs/cgroup/cgroup.subtree_control
+      echo +cpu +memory +io > /sys/fs/cgroup/exec_env/cgroup.subtree_control
     """
     # cria o diretório pai (exec_env)
     _sudo_sh(f"mkdir -p {PROJECT_CGROUP_PARENT}")
 
     # habilita controladores no topo do cgroup v2
-    _sudo_sh(f'echo +cpu +memory > {CGROUP_ROOT}/cgroup.subtree_control')
+    _sudo_sh(f'echo +cpu +memory +io > {CGROUP_ROOT}/cgroup.subtree_control')
 
     # habilita controladores também no nível exec_env
-    _sudo_sh(f'echo +cpu +memory > {PROJECT_CGROUP_PARENT}/cgroup.subtree_control')
+    _sudo_sh(f'echo +cpu +memory +io > {PROJECT_CGROUP_PARENT}/cgroup.subtree_control')
+
+
+def io_weight(io) -> int:
+    """Nível de io (1..10) -> IOWeight do systemd (1..10000)."""
+    return max(1, min(10000, int(io) * 100))
+
+
+def io_bandwidth_bytes(io) -> int:
+    """Nível de io -> bytes/s de leitura e escrita (0 = sem limite de banda)."""
+    if not IO_DEVICE or IO_MBPS_PER_LEVEL <= 0:
+        return 0
+    return int(io) * IO_MBPS_PER_LEVEL * 1024 * 1024
 
 
-def _snapshot_cgroup_limits(namespace: str, cpu_req: float, mem_req_mb: int):
+def io_properties(io) -> list:
+    """
+    Propriedades systemd que aplicam o io pedido:
+    IOWeight sempre; IORead/WriteBandwidthMax se houver disco configurado.
+    """
+    props = ["IOAccounting=yes", f"IOWeight={io_weight(io)}"]
+    bw = io_bandwidth_bytes(io)
+    if bw:
+        props.append(f"IOReadBandwidthMax={IO_DEVICE} {bw}")
+        props.append(f"IOWriteBandwidthMax={IO_DEVICE} {bw}")
+    return props
+
+
+def _snapshot_cgroup_limits(namespace: str, cpu_req: float, mem_req_mb: int, io_req=None):
     """
     Cria /sys/fs/cgroup/exec_env/<namespace> e grava limites equivalentes
     ao que passamos pro systemd-run:
 
       cpu.max      -> baseado em cpu_req (quantos "núcleos" lógicos o usuário pediu)
       memory.max   -> baseado em mem_req_mb (MB do slider)
+      io.weight    -> baseado em io_req (nível 1..10)
+      io.max       -> banda por disco, se EXECENV_IO_DEVICE estiver configurado
 
     Importante:
     NÃO movemos o processo pra esse cgroup.
@@ -88,15 +139,48 @@ def _snapshot_cgroup_limits(namespace: str, cpu_req: float, mem_req_mb: int):
     mem_bytes = int(mem_req_mb) * 1024 * 1024
     _sudo_sh(f'echo "{mem_bytes}" > {ns_cgroup}/memory.max')
 
+    if io_req is None:
+        return
+
+    # ----- io.weight / io.max -----
+    _sudo_sh(f'echo "default {io_weight(io_req)}" > {ns_cgroup}/io.weight')
+
+    bw = io_bandwidth_bytes(io_req)
+    if bw:
+        # io.max é por dispositivo: "<major>:<minor> rbps=<bytes> wbps=<bytes>"
+        rdev = os.stat(IO_DEVICE).st_rdev
+        dev = f"{os.major(rdev)}:{os.minor(rdev)}"
+        _sudo_sh(f'echo "{dev} rbps={bw} wbps={bw}" > {ns_cgroup}/io.max')
 
-def run_command(namespace, command, cpu=1.0, memory=512):
+
+def wait_main_pid(unit_name, tries=20):
+    """
+    Espera o systemd atribuir o MainPID da unit (~2 segundos de tentativas).
+    Retorna o PID ou None.
+    """
+    for _ in range(tries):
+        try:
+            mpid = subprocess.check_output(
+                ["systemctl", "show", unit_name, "-p", "MainPID", "--value"],
+                stderr=subprocess.DEVNULL
+            ).decode().strip()
+            if mpid and mpid != "0":
+                return int(mpid)
+        except Exception:
+            pass
+        time.sleep(0.1)
+    return None
+
+
+def run_command(namespace, command, cpu=1.0, memory=512, io=None):
     """
     1. Cria pasta environments/<namespace> e define output.log
     2. Sobe processo via systemd-run com limites reais:
          -p MemoryMax=...
          -p CPUQuota=...
+         -p IOWeight=... (e IORead/WriteBandwidthMax, ver io_properties)
     3. Captura o PID principal via systemctl show <unit>.MainPID
-    4. Cria /sys/fs/cgroup/exec_env/<namespace> e escreve cpu.max/memory.max
+    4. Cria /sys/fs/cgroup/exec_env/<namespace> e escreve cpu.max/memory.max/io.*
        (espelho das configurações), sem mover o processo pra lá.
     """
 
@@ -124,32 +208,293 @@ def run_command(namespace, command, cpu=1.0, memory=512):
         "-p", "TimeoutStopSec=5s",
         "-p", f"StandardOutput=append:{output_path}",
         "-p", f"StandardError=append:{output_path}",
-        "/bin/bash", "-lc", f"exec {command}"
     ]
+    if io is not None:
+        for prop in io_properties(io):
+            cmd.extend(["-p", prop])
+    cmd.extend(["/bin/bash", "-lc", f"exec {command}"])
 
     subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
     # tenta capturar o MainPID atribuído pelo systemd-run
-    main_pid = None
-    for _ in range(20):  # ~2 segundos de tentativas
-        try:
-            mpid = subprocess.check_output(
-                ["systemctl", "show", unit_name, "-p", "MainPID", "--value"],
-                stderr=subprocess.DEVNULL
-            ).decode().strip()
-            if mpid and mpid != "0":
-                main_pid = int(mpid)
-                break
-        except Exception:
-            pass
-        time.sleep(0.1)
+    main_pid = wait_main_pid(unit_name)
 
     # snapshot dos limites no cgroup "espelho"
+    mirror_cgroup_limits(namespace, cpu, memory, io)
+
+    return unit_name, main_pid, output_path
+
+
+def mirror_cgroup_limits(namespace, cpu, memory, io=None):
+    """
+    Grava o espelho /sys/fs/cgroup/exec_env/<namespace> sem derrubar o fluxo.
+    """
     try:
-        _snapshot_cgroup_limits(namespace, cpu_req=cpu, mem_req_mb=memory)
+        _snapshot_cgroup_limits(namespace, cpu_req=cpu, mem_req_mb=memory, io_req=io)
     except Exception as e:
         # se der erro (por ex, host em modo híbrido cgroup v1), não derruba o fluxo
         # print(f"[WARN] Falha cgroup snapshot: {e}")
         pass
 
-    return unit_name, main_pid, output_path
+
+def resize_unit(namespace, unit_name, cpu, memory, io=None):
+    """
+    Altera ao vivo os limites de uma unit em execução:
+
+      sudo systemctl set-property --runtime <unit> MemoryMax=...M CPUQuota=...% [IOWeight=...]
+
+    --runtime: vale só até a unit sumir, não grava drop-in em /etc.
+    Depois atualiza o espelho em /sys/fs/cgroup/exec_env/<namespace>.
+    Retorna True se o systemd aceitou.
+    """
+    quota_str = f"{float(cpu) * 100.0:.1f}%"
+    props = [f"MemoryMax={int(memory)}M", f"CPUQuota={quota_str}"]
+    if io is not None:
+        props.extend(io_properties(io))
+    res = subprocess.run(
+        ["sudo", "systemctl", "set-property", "--runtime", unit_name, *props],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    if res.returncode != 0:
+        return False
+    mirror_cgroup_limits(namespace, cpu, memory, io)
+    return True
+
+
+def systemd_props(unit_name: str) -> dict:
+    """
+    Lê propriedades relevantes do systemd para uma unit (service/scope).
+    Retorna dict com chaves de interesse; se não existir, LoadState=not-found.
+    """
+    keys = [
+        "LoadState",
+        "ActiveState",
+        "SubState",
+        "Result",
+        "ExecMainStatus",
+        "MainPID",
+    ]
+    args = ["systemctl", "show", unit_name]
+    for k in keys:
+        args.extend(["-p", k])
+    try:
+        out = subprocess.check_output(args, stderr=subprocess.DEVNULL).decode().splitlines()
+    except subprocess.CalledProcessError:
+        return {"LoadState": "not-found"}
+    props = {}
+    for line in out:
+        if not line or "=" not in line:
+            continue
+        k, v = line.split("=", 1)
+        if k in keys:
+            props[k] = v if v != "" else None
+    if "ActiveState" not in props:
+        props["LoadState"] = "not-found"
+    return props
+
+
+def read_proc_io(pid: int):
+    """Retorna (read_bytes, write_bytes) do /proc/<pid>/io se possível."""
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            data = f.read().splitlines()
+        vals = {}
+        for line in data:
+            if ":" in line:
+                k, v = line.split(":", 1)
+                vals[k.strip()] = int(v.strip())
+        r = vals.get("read_bytes") or vals.get("rchar") or 0
+        w = vals.get("write_bytes") or vals.get("wchar") or 0
+        return int(r), int(w)
+    except Exception:
+        return 0, 0
+
+
+def read_unit_io_stat(unit_name):
+    """
+    Soma rbytes/wbytes de todos os discos no io.stat do cgroup da unit
+    (inclui filhos do processo principal, ao contrário de /proc/<pid>/io).
+    Retorna (read_bytes, write_bytes) ou None se o arquivo não existir.
+    """
+    path = os.path.join(SYSTEM_SLICE, unit_name, "io.stat")
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    r = w = 0
+    for line in lines:
+        # "8:0 rbytes=1234 wbytes=5678 rios=1 wios=2 dbytes=0 dios=0"
+        for field in line.split()[1:]:
+            k, _, v = field.partition("=")
+            if k == "rbytes":
+                r += int(v)
+            elif k == "wbytes":
+                w += int(v)
+    return r, w
+
+
+def read_unit_memory_current(unit_name):
+    """
+    memory.current do cgroup da unit em MB: é o que o MemoryMax limita
+    (processo principal, filhos e page cache). None se não existir.
+    """
+    path = os.path.join(SYSTEM_SLICE, unit_name, "memory.current")
+    try:
+        with open(path, "r") as f:
+            return int(int(f.read().strip()) / (1024 * 1024))
+    except (OSError, ValueError):
+        return None
+
+
+def read_pressure(path):
+    """
+    Lê um arquivo PSI:
+        some avg10=1.23 avg60=0.50 avg300=0.10 total=123456
+        full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+    e devolve {"some_avg10": 1.23, "some_avg60": 0.5, "full_avg10": 0.0, ...}.
+    None se o arquivo não existir (kernel sem PSI, unit já coletada).
+    """
+    try:
+        with open(path, "r") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    values = {}
+    for line in lines:
+        parts = line.split()
+        if not parts or parts[0] not in ("some", "full"):
+            continue
+        for field in parts[1:]:
+            k, _, v = field.partition("=")
+            if k in ("avg10", "avg60"):
+                values[f"{parts[0]}_{k}"] = float(v)
+    return values
+
+
+def host_pressure() -> dict:
+    """PSI do host para cpu/memória/io (valores None se indisponíveis)."""
+    return {
+        res: read_pressure(os.path.join(HOST_PRESSURE_DIR, res))
+        for res in PSI_RESOURCES
+    }
+
+
+def unit_pressure(unit_name) -> dict:
+    """PSI do cgroup da unit (cpu.pressure, memory.pressure, io.pressure)."""
+    return {
+        res: read_pressure(os.path.join(SYSTEM_SLICE, unit_name, f"{res}.pressure"))
+        for res in PSI_RESOURCES
+    }
+
+
+def sample_process(pid: int, unit_name=None) -> dict:
+    """
+    Coleta métricas vivas de um PID deste host:
+    CPU %, RSS (MB), IO lido/escrito e nome do processo.
+    Com unit_name, o IO vem do io.stat do cgroup da unit e também
+    calculamos a vazão (bytes/s) desde a amostra anterior; a pressão
+    (PSI) da unit vai em "pressure" e o memory.current em "unit_memory_mb".
+    Se o processo já morreu (ou não temos permissão), devolve zeros.
+    """
+    sample = {
+        "cpu_pct": 0.0,
+        "rss_mb": 0,
+        "io_read": 0,
+        "io_write": 0,
+        "io_read_bps": 0,
+        "io_write_bps": 0,
+        "process_name": "",
+        "pressure": None,
+        "unit_memory_mb": None,
+    }
+    if not pid or pid <= 0:
+        return sample
+    try:
+        p = psutil.Process(pid)
+        sample["process_name"] = p.name()
+        sample["cpu_pct"] = p.cpu_percent(interval=0.05)
+        sample["rss_mb"] = int((p.memory_info().rss or 0) / (1024 * 1024))
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return sample
+
+    if unit_name:
+        sample["pressure"] = unit_pressure(unit_name)
+        sample["unit_memory_mb"] = read_unit_memory_current(unit_name)
+
+    io = read_unit_io_stat(unit_name) if unit_name else None
+    if io is None:
+        sample["io_read"], sample["io_write"] = read_proc_io(pid)
+        return sample
+
+    sample["io_read"], sample["io_write"] = io
+    now = time.monotonic()
+    prev = _last_io.get(unit_name)
+    _last_io[unit_name] = (now, io[0], io[1])
+    if prev and now > prev[0]:
+        dt = now - prev[0]
+        sample["io_read_bps"] = max(0, int((io[0] - prev[1]) / dt))
+        sample["io_write_bps"] = max(0, int((io[1] - prev[2]) / dt))
+    return sample
+
+
+def host_capacity() -> dict:
+    """
+    Capacidade física deste host: vCPUs lógicas e memória total em MB.
+    É o que um nó anuncia para o manager central.
+    """
+    return {
+        "cpu": float(psutil.cpu_count() or 1),
+        "memory": int(psutil.virtual_memory().total / (1024 * 1024)),
+        "io": IO_CAPACITY,
+    }
+
+
+def kill_unit(unit_name, main_pid=None):
+    """
+    Encerra a unit no systemd (SIGTERM, depois SIGKILL, stop e reset-failed)
+    e, por garantia, manda SIGTERM para o PID principal.
+    """
+    _last_io.pop(unit_name, None)
+    if unit_name:
+        subprocess.run(
+            ["sudo", "systemctl", "kill", unit_name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        time.sleep(0.5)
+        subprocess.run(
+            ["sudo", "systemctl", "kill", "--signal=SIGKILL", unit_name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            ["sudo", "systemctl", "stop", unit_name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        subprocess.run(
+            ["sudo", "systemctl", "reset-failed", unit_name],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    if main_pid:
+        try:
+            os.kill(main_pid, signal.SIGTERM)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+
+def remove_env_dir(namespace):
+    """
+    Tenta remover environments/<ns>. Não falha se der busy
+    ("Text file busy", permissão, etc.).
+    """
+    env_path = os.path.join("environments", namespace)
+    try:
+        if os.path.exists(env_path):
+            shutil.rmtree(env_path)
+    except Exception:
+        pass
@@ -91,7 +91,7 @@ function resetUI() {
     (id) => ($(id).textContent = "—")
   );
 
-  $("#env-table tbody").innerHTML = "";
+  resetEnvTable();
   $("#toasts").innerHTML = "";
 }
 
@@ -362,10 +362,11 @@ $("#refresh-envs").onclick = async () => {
 // auto-refresh da tabela de ambientes
 $("#auto-refresh").onchange = (e) => {
   if (e.target.checked) {
+    // barato: só vem o que mudou desde a última versão
     envsTimer = setInterval(async () => {
       await loadEnvironments();
       await refreshMemoryOnly();
-    }, 5000);
+    }, 1000);
     toast("Auto-refresh ativo.");
   } else if (envsTimer) {
     clearInterval(envsTimer);
@@ -374,32 +375,307 @@ $("#auto-refresh").onchange = (e) => {
   }
 };
 
-// ====== Funções principais ======
-async function loadEnvironments() {
+// ====== Tabela de ambientes (store + janela virtual) ======
+//
+// Os ambientes ficam num Map em memória (chave = namespace) e só o que
+// mudou vem do servidor (/environments?since=<versão>). A tabela desenha
+// apenas as linhas visíveis no scroll e reaproveita os <tr> por chave,
+// mexendo só nas células cujo valor mudou.
+
+const ENV_COLS = 7;
+const ENV_OVERSCAN = 8; // linhas extras acima/abaixo da área visível
+
+const envStore = {
+  rows: new Map(), // namespace -> row
+  byStatus: new Map(), // status -> Set(namespace)
+  version: null, // última versão recebida do servidor
+  view: [], // namespaces filtrados + ordenados (o que a tabela mostra)
+};
+
+const envView = {
+  sortKey: "created_at",
+  sortDir: -1, // -1 desc, 1 asc
+  filterText: "",
+  filterStatus: "",
+  rowHeight: 38, // medido de verdade após o 1º render
+  measured: false,
+  rendered: new Map(), // namespace -> <tr> no DOM
+  rafPending: false,
+};
+
+let envsLoading = null; // evita buscas simultâneas aplicando deltas fora de ordem
+let envsQueued = null;  // próxima busca, pedida durante uma em andamento
+
+function statusOf(row) {
+  return (row.last_status || "—").toLowerCase();
+}
+
+function indexRow(row) {
+  const prev = envStore.rows.get(row.namespace);
+  if (prev) envStore.byStatus.get(statusOf(prev))?.delete(row.namespace);
+
+  // chave numérica de data calculada uma vez, para ordenar barato
+  row._created = Date.parse(row.created_at) || 0;
+  envStore.rows.set(row.namespace, row);
+
+  const st = statusOf(row);
+  if (!envStore.byStatus.has(st)) envStore.byStatus.set(st, new Set());
+  envStore.byStatus.get(st).add(row.namespace);
+}
+
+function resetEnvStore() {
+  for (const tr of envView.rendered.values()) tr.remove();
+  envStore.rows.clear();
+  envStore.byStatus.clear();
+  envStore.version = null;
+  envStore.view = [];
+  envView.rendered.clear();
+}
+
+// aplica filtro (índice por status + trecho do namespace) e ordenação
+function rebuildEnvView() {
+  const source = envView.filterStatus
+    ? envStore.byStatus.get(envView.filterStatus) || new Set()
+    : envStore.rows.keys();
+
+  const text = envView.filterText;
+  const view = [];
+  for (const ns of source) {
+    if (!text || ns.toLowerCase().includes(text)) view.push(ns);
+  }
+
+  const key = envView.sortKey === "created_at" ? "_created" : envView.sortKey;
+  const dir = envView.sortDir;
+  view.sort((a, b) => {
+    let va = envStore.rows.get(a)[key];
+    let vb = envStore.rows.get(b)[key];
+    va = va ?? "";
+    vb = vb ?? "";
+    if (va < vb) return -dir;
+    if (va > vb) return dir;
+    return a < b ? -1 : a > b ? 1 : 0;
+  });
+  envStore.view = view;
+
+  updateStatusFilterOptions();
+  $("#env-count").textContent = `${view.length} de ${envStore.rows.size}`;
+}
+
+// contagem por status direto do índice
+function updateStatusFilterOptions() {
+  const sel = $("#env-filter-status");
+  const current = sel.value;
+  const statuses = [...envStore.byStatus.keys()].sort();
+  const opts = [`<option value="">Todos (${envStore.rows.size})</option>`];
+  for (const st of statuses) {
+    const n = envStore.byStatus.get(st).size;
+    if (!n && st !== current) continue;
+    opts.push(`<option value="${st}">${st} (${n})</option>`);
+  }
+  const html = opts.join("");
+  if (sel.innerHTML !== html) {
+    sel.innerHTML = html;
+    sel.value = current;
+  }
+}
+
+function createEnvRow(ns) {
+  const tr = document.createElement("tr");
+  tr.className = "env-row";
+  tr.dataset.ns = ns;
+  for (let i = 0; i < ENV_COLS; i++) tr.appendChild(document.createElement("td"));
+  const c = tr.children;
+  c[0].className = "mono";
+  c[1].innerHTML = `<span class="pill"></span>`;
+  for (const i of [2, 3, 4, 5]) c[i].className = "mono";
+  return tr;
+}
+
+function setCell(td, text) {
+  if (td.textContent !== text) td.textContent = text;
+}
+
+// só encosta nas células cujo valor mudou
+function patchEnvRow(tr, row) {
+  if (tr._row === row) return;
+  tr._row = row;
+  const c = tr.children;
+  setCell(c[0], row.namespace);
+
+  const pill = c[1].firstChild;
+  const cls = `pill ${pillClass(row.last_status)}`;
+  if (pill.className !== cls) pill.className = cls;
+  setCell(pill, row.last_status || "—");
+
+  setCell(c[2], `${row.last_pid ?? "—"}`);
+  setCell(c[3], `${row.cpu ?? "—"}`);
+  setCell(c[4], `${row.memory ?? "—"}`);
+  setCell(c[5], row.unit_name || "—");
+  setCell(c[6], fmtDate(row.created_at));
+}
+
+function spacerRow(cls) {
+  const tr = document.createElement("tr");
+  tr.className = `spacer ${cls}`;
+  const td = document.createElement("td");
+  td.colSpan = ENV_COLS;
+  tr.appendChild(td);
+  return tr;
+}
+
+// desenha só a fatia visível de envStore.view
+function renderEnvWindow() {
+  envView.rafPending = false;
+  const wrap = $("#env-wrap");
   const tbody = $("#env-table tbody");
-  try {
-    const data = await fetchJSON(`${apiBase}/environments`);
+
+  let top = tbody.querySelector("tr.spacer.top");
+  let bottom = tbody.querySelector("tr.spacer.bottom");
+  if (!top) {
     tbody.innerHTML = "";
-    for (const row of data) {
-      const tr = document.createElement("tr");
-      tr.innerHTML = `
-        <td class="mono">${row.namespace}</td>
-        <td><span class="pill ${pillClass(row.last_status)}">${
-        row.last_status || "—"
-      }</span></td>
-        <td class="mono">${row.last_pid ?? "—"}</td>
-        <td class="mono">${row.cpu ?? "—"}</td>
-        <td class="mono">${row.memory ?? "—"}</td>
-        <td class="mono">${row.unit_name || "—"}</td>
-        <td>${fmtDate(row.created_at)}</td>
-      `;
-      tbody.appendChild(tr);
+    top = spacerRow("top");
+    bottom = spacerRow("bottom");
+    tbody.append(top, bottom);
+  }
+
+  const total = envStore.view.length;
+  const rh = envView.rowHeight;
+  const visible = Math.ceil(wrap.clientHeight / rh) + ENV_OVERSCAN * 2;
+  const start = Math.max(0, Math.floor(wrap.scrollTop / rh) - ENV_OVERSCAN);
+  const end = Math.min(total, start + visible);
+
+  const wanted = new Set(envStore.view.slice(start, end));
+
+  // sai do DOM quem não está mais na janela
+  for (const [ns, tr] of envView.rendered) {
+    if (!wanted.has(ns)) {
+      tr.remove();
+      envView.rendered.delete(ns);
+    }
+  }
+
+  // garante a ordem certa entre os espaçadores, reaproveitando <tr> por chave
+  let cursor = top;
+  for (let i = start; i < end; i++) {
+    const ns = envStore.view[i];
+    let tr = envView.rendered.get(ns);
+    if (!tr) {
+      tr = createEnvRow(ns);
+      envView.rendered.set(ns, tr);
+    }
+    patchEnvRow(tr, envStore.rows.get(ns));
+    if (cursor.nextSibling !== tr) cursor.after(tr);
+    cursor = tr;
+  }
+
+  top.firstChild.style.height = `${start * rh}px`;
+  bottom.firstChild.style.height = `${(total - end) * rh}px`;
+
+  // mede a altura real da linha uma vez (depende do CSS/fonte)
+  if (envView.rendered.size && !envView.measured) {
+    const h = envView.rendered.values().next().value.getBoundingClientRect().height;
+    if (h > 0) {
+      envView.measured = true;
+      if (Math.abs(h - rh) > 0.5) {
+        envView.rowHeight = h;
+        scheduleEnvRender();
+      }
+    }
+  }
+}
+
+function scheduleEnvRender() {
+  if (envView.rafPending) return;
+  envView.rafPending = true;
+  requestAnimationFrame(renderEnvWindow);
+}
+
+function resetEnvTable() {
+  resetEnvStore();
+  $("#env-table tbody").innerHTML = "";
+  $("#env-filter-text").value = "";
+  $("#env-filter-status").value = "";
+  envView.filterText = "";
+  envView.filterStatus = "";
+  $("#env-count").textContent = "";
+}
+
+// ====== Funções principais ======
+function loadEnvironments() {
+  if (envsLoading) {
+    // a busca em andamento pode ter saído antes da ação que pediu o reload
+    // (create/execute/terminate): agenda mais uma, compartilhada entre quem
+    // chamar até ela começar
+    if (!envsQueued) {
+      envsQueued = envsLoading.then(() => {
+        envsQueued = null;
+        return loadEnvironments();
+      });
+    }
+    return envsQueued;
+  }
+  envsLoading = fetchEnvironmentChanges().finally(() => {
+    envsLoading = null;
+  });
+  return envsLoading;
+}
+
+async function fetchEnvironmentChanges() {
+  try {
+    // since=0 -> servidor manda tudo (full) na primeira vez
+    const since = envStore.version ?? 0;
+    const data = await fetchJSON(`${apiBase}/environments?since=${since}`);
+
+    if (data.full) resetEnvStore();
+    else if (envStore.version !== null && data.version < envStore.version) return;
+
+    for (const row of data.rows) indexRow(row);
+    envStore.version = data.version;
+
+    if (data.full || data.rows.length) {
+      rebuildEnvView();
+      scheduleEnvRender();
     }
   } catch (err) {
     toast(`Erro ao listar ambientes: ${err.message}`, "err");
   }
 }
 
+// scroll, ordenação e filtros da tabela
+$("#env-wrap").addEventListener("scroll", scheduleEnvRender, { passive: true });
+window.addEventListener("resize", scheduleEnvRender);
+
+document.querySelectorAll("#env-table th[data-sort]").forEach((th) => {
+  th.onclick = () => {
+    const key = th.dataset.sort;
+    if (envView.sortKey === key) envView.sortDir = -envView.sortDir;
+    else {
+      envView.sortKey = key;
+      envView.sortDir = 1;
+    }
+    document
+      .querySelectorAll("#env-table th[data-sort]")
+      .forEach((h) => h.classList.remove("asc", "desc"));
+    th.classList.add(envView.sortDir === 1 ? "asc" : "desc");
+    rebuildEnvView();
+    scheduleEnvRender();
+  };
+});
+
+$("#env-filter-text").oninput = (e) => {
+  envView.filterText = e.target.value.trim().toLowerCase();
+  rebuildEnvView();
+  $("#env-wrap").scrollTop = 0;
+  scheduleEnvRender();
+};
+
+$("#env-filter-status").onchange = (e) => {
+  envView.filterStatus = e.target.value;
+  rebuildEnvView();
+  $("#env-wrap").scrollTop = 0;
+  scheduleEnvRender();
+};
+
 function pillClass(status) {
   switch ((status || "").toLowerCase()) {
     case "running":
@@ -1,44 +1,36 @@
+import math
 import os
-import shutil
-import signal
-import psutil
-import subprocess
+import threading
 import time
 from models import Environment
-from executor import run_command
+from nodes import load_nodes, NodeError
 from db import query, execute
 
-
-def _systemd_props(unit_name: str) -> dict:
-    """
-    Lê propriedades relevantes do systemd para uma unit (service/scope).
-    Retorna dict com chaves de interesse; se não existir, LoadState=not-found.
-    """
-    keys = [
-        "LoadState",
-        "ActiveState",
-        "SubState",
-        "Result",
-        "ExecMainStatus",
-        "MainPID",
-    ]
-    args = ["systemctl", "show", unit_name]
-    for k in keys:
-        args.extend(["-p", k])
-    try:
-        out = subprocess.check_output(args, stderr=subprocess.DEVNULL).decode().splitlines()
-    except subprocess.CalledProcessError:
-        return {"LoadState": "not-found"}
-    props = {}
-    for line in out:
-        if not line or "=" not in line:
-            continue
-        k, v = line.split("=", 1)
-        if k in keys:
-            props[k] = v if v != "" else None
-    if "ActiveState" not in props:
-        props["LoadState"] = "not-found"
-    return props
+# Política de alocação de ambientes entre os nós:
+#   best-fit -> nó que fica com MENOS memória sobrando (empacota)
+#   spread   -> nó que fica com MAIS memória sobrando (espalha)
+PLACEMENT_POLICY = os.environ.get("EXECENV_PLACEMENT", "best-fit")
+
+# Right-sizing a partir do histórico de env_metrics:
+#   memória = pico de RSS * folga, arredondado para múltiplos de 64 MB
+#   cpu     = p95 do uso de CPU (em núcleos) * folga, arredondado para 0.1
+RIGHTSIZE_MIN_SAMPLES = 5
+RIGHTSIZE_HEADROOM = 1.2
+RIGHTSIZE_HISTORY = 2000
+
+# Admissão sensível a pressão (PSI). EXECENV_PSI_<CPU|MEMORY|IO>_MAX é o
+# limite em % de "some avg10" de cada recurso no nó; sem a variável,
+# aquele recurso não é olhado. Ao passar do limite o /execute é:
+#   reject -> recusado na hora
+#   delay  -> segurado até EXECENV_PSI_DELAY_SEC esperando a pressão cair
+PSI_THRESHOLDS = {
+    res: float(os.environ[f"EXECENV_PSI_{res.upper()}_MAX"])
+    for res in ("cpu", "memory", "io")
+    if os.environ.get(f"EXECENV_PSI_{res.upper()}_MAX")
+}
+PSI_ACTION = os.environ.get("EXECENV_PSI_ACTION", "reject")
+PSI_DELAY_SEC = float(os.environ.get("EXECENV_PSI_DELAY_SEC", "10"))
+PSI_POLL_SEC = 1.0
 
 
 def _map_systemd_to_status(props: dict) -> str:
@@ -111,96 +103,239 @@ def _map_systemd_to_status(props: dict) -> str:
     return "unknown"
 
 
-def _read_proc_io(pid: int):
-    """Retorna (read_bytes, write_bytes) do /proc/<pid>/io se possível."""
-    try:
-        with open(f"/proc/{pid}/io", "r") as f:
-            data = f.read().splitlines()
-        vals = {}
-        for line in data:
-            if ":" in line:
-                k, v = line.split(":", 1)
-                vals[k.strip()] = int(v.strip())
-        r = vals.get("read_bytes") or vals.get("rchar") or 0
-        w = vals.get("write_bytes") or vals.get("wchar") or 0
-        return int(r), int(w)
-    except Exception:
-        return 0, 0
+def _pressure_excess(pressure) -> list:
+    """
+    Recursos do nó acima do limite configurado, já formatados para a
+    mensagem de erro (ex: ["memory 42.0% > 20.0%"]).
+    """
+    excess = []
+    for res, limit in PSI_THRESHOLDS.items():
+        values = (pressure or {}).get(res) or {}
+        avg10 = values.get("some_avg10")
+        if avg10 is not None and avg10 > limit:
+            excess.append(f"{res} {avg10:.1f}% > {limit:.1f}%")
+    return excess
+
+
+def _worst_pressure(pressures) -> dict:
+    """Maior avg10/avg60 de cada recurso entre vários nós."""
+    worst = {}
+    for pressure in pressures:
+        for res, values in (pressure or {}).items():
+            if not values:
+                continue
+            acc = worst.setdefault(res, {})
+            for k, v in values.items():
+                acc[k] = max(acc.get(k, 0.0), v)
+    return worst
 
 
 class EnvironmentManager:
     def __init__(self):
         self.environments = {}
+        # nós de execução (host local e/ou agentes remotos)
+        self.nodes = load_nodes()
+        self.default_node = next(iter(self.nodes))
+
+        # Versão de mudanças: cresce a cada alteração de status/métrica de
+        # algum ambiente. Começa no relógio (ms) para continuar crescendo
+        # entre reinícios da API; versões anteriores a _version_base não
+        # são conhecidas e caem na listagem completa.
+        self._version_lock = threading.Lock()
+        self._version_base = int(time.time() * 1000)
+        self.version = self._version_base
+        self._row_versions = {}     # namespace -> versão da última mudança
+        self._last_metric = {}      # namespace -> última amostra gravada
+        self._reserved_cache = None  # (versão, _reserved_by_node)
+        self._list_cache = None      # (versão, list_environments)
+
+    def _touch(self, namespace):
+        """Marca o ambiente como alterado e avança a versão."""
+        with self._version_lock:
+            self.version += 1
+            self._row_versions[namespace] = self.version
+
+    def _node_for(self, env: Environment):
+        """Nó dono do ambiente (ambientes antigos, sem nó, caem no padrão)."""
+        return self.nodes.get(env.node or self.default_node) or self.nodes[self.default_node]
 
     # ===== reservas ativas =====
-    def _reserved_totals(self):
+    def _reserved_by_node(self):
         """
-        Soma das reservas de CPU e MEMÓRIA dos ambientes que estão
-        em execução ou subindo (status 'running' ou 'starting').
+        Soma das reservas de CPU, MEMÓRIA e IO dos ambientes que estão
+        em execução ou subindo (status 'running' ou 'starting'),
+        separada por nó.
 
-        Isso representa o quanto já está "comprometido" e não deve mais
-        aparecer como disponível para novos ambientes.
+        Isso representa o quanto já está "comprometido" em cada nó e não
+        deve mais aparecer como disponível para novos ambientes.
+
+        Só muda quando algum ambiente muda, então fica em cache pela versão.
         """
+        version = self.version
+        if self._reserved_cache and self._reserved_cache[0] == version:
+            return self._reserved_cache[1]
+
         rows = query(
             """
-            SELECT
+            SELECT node,
               COALESCE(SUM(CASE WHEN last_status IN ('running','starting')
                                 THEN memory END),0) AS mem_sum,
               COALESCE(SUM(CASE WHEN last_status IN ('running','starting')
-                                THEN cpu END),0) AS cpu_sum
+                                THEN cpu END),0) AS cpu_sum,
+              COALESCE(SUM(CASE WHEN last_status IN ('running','starting')
+                                THEN io END),0) AS io_sum
             FROM environments
+            GROUP BY node
             """
         )
-        if rows:
-            r = rows[0]
-            reserved_mem = int(r["mem_sum"] or 0)
-            reserved_cpu = float(r["cpu_sum"] or 0.0)
+        reserved = {}
+        for r in rows:
+            node_id = r.get("node") or self.default_node
+            cpu_sum, mem_sum, io_sum = reserved.get(node_id, (0.0, 0, 0))
+            reserved[node_id] = (
+                cpu_sum + float(r["cpu_sum"] or 0.0),
+                mem_sum + int(r["mem_sum"] or 0),
+                io_sum + int(r["io_sum"] or 0),
+            )
+        self._reserved_cache = (version, reserved)
+        return reserved
+
+    def _reserved_totals(self):
+        """Reservas somadas de todos os nós: (cpu, memória MB, io)."""
+        reserved_cpu = 0.0
+        reserved_mem = 0
+        reserved_io = 0
+        for cpu_sum, mem_sum, io_sum in self._reserved_by_node().values():
+            reserved_cpu += cpu_sum
+            reserved_mem += mem_sum
+            reserved_io += io_sum
+        return reserved_cpu, reserved_mem, reserved_io
+
+    def _node_resources(self):
+        """
+        Capacidade e saldo de cada nó alcançável.
+        Nós cujo agente não responde ficam de fora (não recebem ambientes):
+        a capacidade fica em cache, então pool e pressão servem de teste
+        de vida a cada chamada.
+        """
+        reserved = self._reserved_by_node()
+        result = []
+        for node_id, node in self.nodes.items():
+            try:
+                cap = node.capacity()
+            except NodeError:
+                continue
+            reserved_cpu, reserved_mem, reserved_io = reserved.get(node_id, (0.0, 0, 0))
+            io_total = int(cap.get("io") or 0)
+            try:
+                pool = node.pool_status()
+                pressure = node.pressure()
+            except NodeError:
+                continue
+            result.append({
+                "node": node_id,
+                "cpu_total": float(cap["cpu"]),
+                "memory_total": int(cap["memory"]),
+                "cpu_reserved": reserved_cpu,
+                "memory_reserved": reserved_mem,
+                "memory_available": max(0, int(cap["memory"] - reserved_mem)),
+                # io_total=0: nó sem orçamento de io (não limita admissão)
+                "io_total": io_total,
+                "io_reserved": reserved_io,
+                "io_available": max(0, io_total - reserved_io) if io_total else None,
+                "pool": pool,
+                "pressure": pressure,
+                "under_pressure": bool(_pressure_excess(pressure)),
+            })
+        return result
+
+    def _place(self, cpu, memory, node_resources, io=0):
+        """
+        Escolhe o nó para um novo ambiente segundo PLACEMENT_POLICY.
+        Só entram nós com vCPUs suficientes, memória livre >= pedida e,
+        se o nó tiver orçamento de io, io livre >= pedido.
+        Retorna o id do nó ou None se ninguém comporta.
+        """
+        fits = [
+            n for n in node_resources
+            if n["cpu_total"] >= cpu
+            and n["memory_available"] >= memory
+            and (n["io_available"] is None or n["io_available"] >= io)
+        ]
+        if not fits:
+            return None
+        # nós acima dos limites de PSI só recebem ambiente se não houver outro
+        healthy = [n for n in fits if not n["under_pressure"]]
+        fits = healthy or fits
+        if PLACEMENT_POLICY == "spread":
+            best = max(fits, key=lambda n: (n["memory_available"], -n["cpu_reserved"]))
         else:
-            reserved_mem = 0
-            reserved_cpu = 0.0
-        return reserved_cpu, reserved_mem
+            best = min(fits, key=lambda n: (n["memory_available"] - memory, n["cpu_reserved"]))
+        return best["node"]
 
     def get_available_resources(self):
         """
         Retorna os recursos DISPONÍVEIS considerando reservas ativas.
 
         Memória:
-            total_mem_mb (memória física da VM)
-          - soma(memory) de todos os ambientes com status running/starting
-          = memory_available
+            total_mem_mb (memória física de cada nó)
+          - soma(memory) dos ambientes running/starting daquele nó
+          = memória livre do nó; memory_available é a soma entre os nós.
 
         Se a VM tem 3000 MB totais e existe um ambiente rodando
         com reserva de 2000 MB, retornamos ~1000 MB disponíveis.
 
         CPU:
-            usamos psutil.cpu_count() (lógico) para refletir as vCPUs da VM.
+            vCPUs lógicas do MAIOR nó (um ambiente não atravessa nós).
             Aqui NÃO descontamos reservas de CPU porque você só quer
             ajuste dinâmico na memória.
-        """
-        total_cores = psutil.cpu_count() or 1
-        total_mem_mb = int(psutil.virtual_memory().total / (1024 * 1024))
 
-        reserved_cpu, reserved_mem = self._reserved_totals()
+        IO:
+            mesma conta da memória, em níveis de io (1..10 por ambiente),
+            somando só os nós com orçamento (EXECENV_IO_CAPACITY/--io).
+            io_available=None quando nenhum nó contabiliza io.
+
+        Pressão:
+            "pressure" traz o pior avg10/avg60 (PSI) de cpu/memória/io entre
+            os nós; por nó também vem "under_pressure" conforme os limites.
+
+        Em "nodes" vai o detalhamento por nó.
 
-        avail_mem = max(0, int(total_mem_mb - reserved_mem))
-        avail_cpu = float(total_cores)
+        Pool quente:
+            pool_reserved_* soma os limites dos slots prontos. É só
+            informativo: slot ocioso não consome nada e, quando vira
+            ambiente, já entra nas reservas acima como 'running'.
+        """
+        node_resources = self._node_resources()
+
+        avail_mem = sum(n["memory_available"] for n in node_resources)
+        avail_cpu = max((n["cpu_total"] for n in node_resources), default=0.0)
+        pools = [n["pool"] for n in node_resources if n["pool"]]
+        io_nodes = [n for n in node_resources if n["io_available"] is not None]
+        avail_io = sum(n["io_available"] for n in io_nodes) if io_nodes else None
 
         return {
             'cpu_available': avail_cpu,
-            'memory_available': avail_mem
+            'memory_available': avail_mem,
+            'io_available': avail_io,
+            'pool_reserved_cpu': sum(p["reserved_cpu"] for p in pools),
+            'pool_reserved_memory': sum(p["reserved_memory"] for p in pools),
+            'pressure': _worst_pressure(n["pressure"] for n in node_resources),
+            'nodes': node_resources,
         }
 
     # --- Persistência: helpers ---
     def _db_upsert_env(self, env: Environment):
         execute(
             """
-            INSERT INTO environments (namespace, command, cpu, memory, io, unit_name, last_status, last_pid, process_name)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s,''))
+            INSERT INTO environments (namespace, command, cpu, memory, io, node, unit_name, last_status, last_pid, process_name)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s,''))
             ON DUPLICATE KEY UPDATE
               command=VALUES(command),
               cpu=VALUES(cpu),
               memory=VALUES(memory),
               io=VALUES(io),
+              node=VALUES(node),
               unit_name=VALUES(unit_name),
               last_status=VALUES(last_status),
               last_pid=VALUES(last_pid),
@@ -212,12 +347,14 @@ class EnvironmentManager:
                 env.cpu,
                 env.memory,
                 env.io,
+                env.node,
                 env.unit_name,
                 env.status,
                 env.main_pid,
                 None,
             ),
         )
+        self._touch(env.namespace)
 
     def _db_insert_metric(
         self,
@@ -228,13 +365,14 @@ class EnvironmentManager:
         rss_mb: int,
         io_read: int,
         io_write: int,
+        unit_mem_mb=None,
     ):
         execute(
             """
-            INSERT INTO env_metrics (namespace, status, cpu_pct, rss_mb, io_read, io_write, pid)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            INSERT INTO env_metrics (namespace, status, cpu_pct, rss_mb, io_read, io_write, pid, unit_mem_mb)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
             """,
-            (namespace, status, cpu_pct, rss_mb, io_read, io_write, pid),
+            (namespace, status, cpu_pct, rss_mb, io_read, io_write, pid, unit_mem_mb),
         )
         execute(
             """
@@ -244,6 +382,11 @@ class EnvironmentManager:
             """,
             (status, pid or 0, namespace),
         )
+        # amostra idêntica à anterior não conta como mudança
+        state = (status, pid or 0, round(cpu_pct, 1), rss_mb, io_read, io_write)
+        if self._last_metric.get(namespace) != state:
+            self._last_metric[namespace] = state
+            self._touch(namespace)
 
     # --- CRUD lógico ---
     def create_environment(self, data):
@@ -254,6 +397,15 @@ class EnvironmentManager:
         resources = self.get_available_resources()
         requested_cpu = float(data.get("cpu", 1))
         requested_memory = int(data.get("memory", 128))
+        requested_io = int(data.get("io", 1))
+
+        # rightsize=true: troca o pedido pelo tamanho sugerido pelo histórico
+        # do mesmo comando (se houver amostras suficientes)
+        if data.get("rightsize"):
+            rec = self.recommend_limits(data.get("command", ""))
+            if rec:
+                requested_cpu = rec["cpu"]
+                requested_memory = rec["memory"]
 
         if requested_cpu > resources["cpu_available"]:
             return {
@@ -271,13 +423,33 @@ class EnvironmentManager:
                 )
             }
 
+        if resources["io_available"] is not None and requested_io > resources["io_available"]:
+            return {
+                "error": (
+                    f"IO solicitado ({requested_io}) excede o disponível "
+                    f'({resources["io_available"]})'
+                )
+            }
+
+        node_id = self._place(
+            requested_cpu, requested_memory, resources["nodes"], requested_io
+        )
+        if node_id is None:
+            return {
+                "error": (
+                    f"Nenhum nó comporta {requested_cpu} CPU, "
+                    f"{requested_memory}MB e io {requested_io} ao mesmo tempo"
+                )
+            }
+
         env = Environment(
             namespace=data["namespace"],
             cpu=requested_cpu,
             memory=requested_memory,
-            io=int(data.get("io", 1)),
+            io=requested_io,
             command=data.get("command", ""),
         )
+        env.node = node_id
         self.environments[env.namespace] = env
         env.status = "created"
 
@@ -298,15 +470,24 @@ class EnvironmentManager:
                 return {"error": "Namespace não encontrado"}
             row = rows[0]
             env = Environment(ns, row["cpu"], row["memory"], row["io"], row["command"])
+            env.node = row.get("node")
             env.unit_name = row.get("unit_name")
             env.main_pid = row.get("last_pid") or None
             self.environments[ns] = env
 
-        env.status = "running"
+        node = self._node_for(env)
+        blocked = self._wait_for_pressure(node)
+        if blocked:
+            return {"error": blocked}
 
-        unit_name, main_pid, path = run_command(
-            ns, env.command, env.cpu, env.memory
-        )
+        try:
+            unit_name, main_pid, path = node.run(
+                ns, env.command, env.cpu, env.memory, env.io
+            )
+        except NodeError as e:
+            return {"error": f"Falha ao executar no nó {node.node_id}: {e}"}
+
+        env.status = "running"
         env.unit_name = unit_name
         env.main_pid = main_pid
 
@@ -317,29 +498,49 @@ class EnvironmentManager:
             "output_path": path,
             "unit": unit_name,
             "pid": main_pid,
+            "node": node.node_id,
         }
 
+    def _wait_for_pressure(self, node):
+        """
+        Portão de PSI antes de lançar no nó. Retorna None se pode seguir
+        ou a mensagem de erro se o nó continua acima dos limites
+        (na hora, com PSI_ACTION=reject; após PSI_DELAY_SEC, com delay).
+        """
+        if not PSI_THRESHOLDS:
+            return None
+        wait = PSI_DELAY_SEC if PSI_ACTION == "delay" else 0.0
+        deadline = time.monotonic() + wait
+        while True:
+            try:
+                excess = _pressure_excess(node.pressure())
+            except NodeError:
+                # sem leitura de pressão, quem decide é o próprio run
+                return None
+            if not excess:
+                return None
+            if time.monotonic() >= deadline:
+                return f"Nó {node.node_id} sob pressão: " + ", ".join(excess)
+            time.sleep(PSI_POLL_SEC)
+
     def _sample_metrics(self, env: Environment, props: dict):
         """
         Coleta métricas vivas (CPU %, RSS MB, IO) e deduz status final.
         Também atualiza o banco com o último status/pid/process_name.
         """
         pid = env.main_pid
-        cpu_pct = 0.0
-        rss_mb = 0
-        io_r = 0
-        io_w = 0
-        pname = ""
-
-        if pid and pid > 0:
-            try:
-                p = psutil.Process(pid)
-                pname = p.name()
-                cpu_pct = p.cpu_percent(interval=0.05)
-                rss_mb = int((p.memory_info().rss or 0) / (1024 * 1024))
-                io_r, io_w = _read_proc_io(pid)
-            except (psutil.NoSuchProcess, psutil.AccessDenied):
-                pass
+        try:
+            sample = self._node_for(env).sample(pid, env.unit_name)
+        except NodeError:
+            sample = None
+        sample = sample or {}
+        cpu_pct = sample.get("cpu_pct", 0.0)
+        rss_mb = sample.get("rss_mb", 0)
+        io_r = sample.get("io_read", 0)
+        io_w = sample.get("io_write", 0)
+        io_r_bps = sample.get("io_read_bps", 0)
+        io_w_bps = sample.get("io_write_bps", 0)
+        pname = sample.get("process_name", "")
 
         status = _map_systemd_to_status(props)
         env.status = status
@@ -358,6 +559,7 @@ class EnvironmentManager:
             int(rss_mb),
             int(io_r),
             int(io_w),
+            sample.get("unit_memory_mb"),
         )
 
         return {
@@ -366,6 +568,9 @@ class EnvironmentManager:
             "rss_mb": rss_mb,
             "io_read": io_r,
             "io_write": io_w,
+            "io_read_bps": io_r_bps,
+            "io_write_bps": io_w_bps,
+            "pressure": sample.get("pressure"),
             "pid": pid,
             "process_name": pname or "",
         }
@@ -391,15 +596,24 @@ class EnvironmentManager:
                 row["io"],
                 row["command"],
             )
+            env.node = row.get("node")
             env.unit_name = row.get("unit_name")
             env.main_pid = row.get("last_pid") or None
             self.environments[namespace] = env
 
         status = env.status or "unknown"
+        io_rates = {"io_read_bps": 0, "io_write_bps": 0}
+        pressure = None
 
+        props = None
         if getattr(env, "unit_name", None):
-            props = _systemd_props(env.unit_name)
+            try:
+                props = self._node_for(env).props(env.unit_name)
+            except NodeError:
+                # nó fora do ar: mantém o último status conhecido
+                props = None
 
+        if props is not None:
             # se ainda não sabíamos pid, tenta puxar do systemd
             if (not getattr(env, "main_pid", None)) or env.main_pid == 0:
                 mpid = props.get("MainPID")
@@ -411,23 +625,260 @@ class EnvironmentManager:
 
             metrics = self._sample_metrics(env, props)
             status = metrics["status"]
+            io_rates["io_read_bps"] = metrics["io_read_bps"]
+            io_rates["io_write_bps"] = metrics["io_write_bps"]
+            pressure = metrics["pressure"]
 
         return {
             "pid": env.main_pid,
             "memory_requested": env.memory,
             "cpu_requested": env.cpu,
+            "io_requested": env.io,
+            **io_rates,
+            "pressure": pressure,
             "status": status,
             "command": env.command,
+            "node": env.node or self.default_node,
+        }
+
+    # --- Right-sizing ---
+    def _load_env(self, namespace):
+        """Ambiente do cache ou do banco (com último status); None se não existe."""
+        env = self.environments.get(namespace)
+        if env:
+            return env
+        rows = query("SELECT * FROM environments WHERE namespace=%s", (namespace,))
+        if not rows:
+            return None
+        row = rows[0]
+        env = Environment(namespace, row["cpu"], row["memory"], row["io"], row["command"])
+        env.node = row.get("node")
+        env.unit_name = row.get("unit_name")
+        env.main_pid = row.get("last_pid") or None
+        env.status = row.get("last_status") or "created"
+        self.environments[namespace] = env
+        return env
+
+    def recommend_limits(self, command):
+        """
+        Sugere limites para um comando a partir das amostras 'running'
+        já gravadas em env_metrics por execuções anteriores dele.
+        A memória parte do maior entre memory.current da unit (o que o
+        MemoryMax limita: filhos e page cache inclusos) e o RSS do PID
+        principal (amostras antigas, sem unit_mem_mb).
+        Retorna None se ainda não há histórico suficiente.
+        """
+        rows = query(
+            """
+            SELECT m.rss_mb, m.unit_mem_mb, m.cpu_pct
+              FROM env_metrics m
+              JOIN environments e ON e.namespace = m.namespace
+             WHERE e.command = %s AND m.status = 'running'
+             ORDER BY m.id DESC
+             LIMIT %s
+            """,
+            (command, RIGHTSIZE_HISTORY),
+        )
+        if len(rows) < RIGHTSIZE_MIN_SAMPLES:
+            return None
+
+        peak_mem = max(
+            max(int(r["rss_mb"] or 0), int(r.get("unit_mem_mb") or 0))
+            for r in rows
+        )
+        # cpu_pct do psutil é % de UM núcleo (200% = 2 núcleos)
+        cores = sorted(float(r["cpu_pct"] or 0.0) / 100.0 for r in rows)
+        p50 = cores[max(0, math.ceil(0.50 * len(cores)) - 1)]
+        p95 = cores[max(0, math.ceil(0.95 * len(cores)) - 1)]
+
+        memory = max(64, math.ceil(peak_mem * RIGHTSIZE_HEADROOM / 64) * 64)
+        cpu = max(0.1, math.ceil(p95 * RIGHTSIZE_HEADROOM * 10) / 10)
+
+        return {
+            "cpu": cpu,
+            "memory": memory,
+            "samples": len(rows),
+            "peak_memory_mb": peak_mem,
+            "cpu_p50": round(p50, 3),
+            "cpu_p95": round(p95, 3),
+        }
+
+    def get_recommendation(self, namespace):
+        env = self._load_env(namespace)
+        if not env:
+            return {"error": "Namespace não encontrado"}
+        rec = self.recommend_limits(env.command)
+        if not rec:
+            return {"error": "Histórico insuficiente para recomendar limites"}
+        return {
+            "namespace": namespace,
+            "current": {"cpu": env.cpu, "memory": env.memory},
+            "recommended": rec,
+        }
+
+    def resize_environment(self, namespace, data):
+        """
+        Muda CPU/memória de um ambiente (PATCH /environments/<ns>).
+
+        Se estiver rodando, aplica ao vivo na unit (systemctl set-property
+        --runtime) no nó dono. Em qualquer caso grava os novos valores no
+        banco, e é isso que _reserved_by_node soma: a reserva passa a
+        refletir o novo tamanho na hora.
+
+        Com {"recommended": true} usa o tamanho sugerido pelo histórico.
+        "io" também pode ser alterado (peso/banda de disco).
+        """
+        env = self._load_env(namespace)
+        if not env:
+            return {"error": "Namespace não encontrado"}
+
+        if data.get("recommended"):
+            rec = self.recommend_limits(env.command)
+            if not rec:
+                return {"error": "Histórico insuficiente para recomendar limites"}
+            new_cpu = rec["cpu"]
+            new_memory = rec["memory"]
+        else:
+            new_cpu = data.get("cpu", env.cpu)
+            new_memory = data.get("memory", env.memory)
+        try:
+            new_cpu = float(new_cpu)
+            new_memory = int(new_memory)
+            new_io = int(data.get("io", env.io))
+        except (TypeError, ValueError):
+            return {"error": "CPU, memória e io precisam ser números"}
+
+        if new_cpu <= 0 or new_memory <= 0 or new_io <= 0:
+            return {"error": "CPU, memória e io precisam ser positivos"}
+
+        node_id = env.node or self.default_node
+        node_res = next(
+            (n for n in self._node_resources() if n["node"] == node_id), None
+        )
+        if node_res is None:
+            return {"error": f"Nó {node_id} indisponível"}
+
+        if new_cpu > node_res["cpu_total"]:
+            return {
+                "error": (
+                    f"CPU solicitada ({new_cpu}) excede o nó "
+                    f'({node_res["cpu_total"]})'
+                )
+            }
+
+        # a reserva atual do próprio ambiente volta para o saldo antes de comparar
+        running = env.status in ("running", "starting")
+        free_mem = node_res["memory_available"] + (env.memory if running else 0)
+        if new_memory > free_mem:
+            return {
+                "error": (
+                    f"Memória solicitada ({new_memory}MB) excede o disponível "
+                    f"({free_mem}MB)"
+                )
+            }
+
+        if node_res["io_available"] is not None:
+            free_io = node_res["io_available"] + (env.io if running else 0)
+            if new_io > free_io:
+                return {
+                    "error": (
+                        f"IO solicitado ({new_io}) excede o disponível ({free_io})"
+                    )
+                }
+
+        live = running and bool(env.unit_name)
+        if live:
+            node = self._node_for(env)
+            try:
+                # encolher abaixo do uso atual mataria o job por OOM; o
+                # MemoryMax vale para a unit inteira (filhos e page cache),
+                # então compara com o memory.current do cgroup
+                if new_memory < env.memory:
+                    sample = node.sample(env.main_pid, env.unit_name) or {}
+                    used_mb = sample.get("unit_memory_mb")
+                    if used_mb is None:
+                        used_mb = sample.get("rss_mb", 0)
+                    if new_memory <= used_mb:
+                        return {
+                            "error": (
+                                f"Memória solicitada ({new_memory}MB) abaixo do "
+                                f"uso atual ({used_mb}MB)"
+                            )
+                        }
+                ok = node.resize(
+                    namespace, env.unit_name, new_cpu, new_memory, new_io
+                )
+            except NodeError as e:
+                return {"error": f"Falha ao redimensionar no nó {node.node_id}: {e}"}
+            if not ok:
+                return {"error": "systemd recusou a alteração de limites"}
+
+        env.cpu = new_cpu
+        env.memory = new_memory
+        env.io = new_io
+        # só os limites: o upsert zeraria process_name e regravaria
+        # last_status a partir do cache
+        execute(
+            "UPDATE environments SET cpu=%s, memory=%s, io=%s WHERE namespace=%s",
+            (new_cpu, new_memory, new_io, namespace),
+        )
+        self._touch(namespace)
+
+        return {
+            "message": "Limites atualizados",
+            "namespace": namespace,
+            "cpu": new_cpu,
+            "memory": new_memory,
+            "io": new_io,
+            "live": live,
         }
 
     def list_environments(self):
         """
         Tabela que o frontend mostra (/environments):
         junta dados persistidos + última métrica coletada.
+
+        Fica em cache pela versão: enquanto nada muda, não vai ao banco.
+        """
+        version = self.version
+        if self._list_cache and self._list_cache[0] == version:
+            return self._list_cache[1]
+        rows = self._query_env_rows()
+        self._list_cache = (version, rows)
+        return rows
+
+    def list_environments_since(self, since):
+        """
+        Modo incremental de /environments?since=<versão>: só as linhas cujo
+        status ou métricas mudaram depois de "since".
+        Se "since" é anterior ao que esta instância conhece, ou maior que a
+        versão atual (cliente de uma instância anterior cuja versão passou
+        à frente do relógio), manda tudo (full=True) para o cliente
+        recomeçar do zero.
         """
+        with self._version_lock:
+            version = self.version
+            changed = [ns for ns, v in self._row_versions.items() if v > since]
+
+        if since < self._version_base or since > version:
+            return {"version": version, "full": True, "rows": self.list_environments()}
+
+        rows = self._query_env_rows(changed) if changed else []
+        return {"version": version, "full": False, "rows": rows}
+
+    def _query_env_rows(self, namespaces=None):
+        """SELECT da listagem; com namespaces, só aquelas linhas."""
+        where = ""
+        metrics_where = ""
+        args = ()
+        if namespaces is not None:
+            marks = ",".join(["%s"] * len(namespaces))
+            where = f"WHERE e.namespace IN ({marks})"
+            metrics_where = f"WHERE namespace IN ({marks})"
+            args = tuple(namespaces) * 2
         rows = query(
-            """
-            SELECT e.namespace, e.command, e.cpu, e.memory, e.io, e.unit_name,
+            f"""
+            SELECT e.namespace, e.command, e.cpu, e.memory, e.io, e.node, e.unit_name,
                    e.created_at, e.last_status, e.last_pid, e.process_name,
                    m.cpu_pct, m.rss_mb, m.io_read, m.io_write, m.ts
               FROM environments e
@@ -435,11 +886,13 @@ class EnvironmentManager:
                  SELECT t1.* FROM env_metrics t1
                  JOIN (
                    SELECT namespace, MAX(id) AS max_id
-                     FROM env_metrics GROUP BY namespace
+                     FROM env_metrics {metrics_where} GROUP BY namespace
                  ) t2 ON t1.namespace = t2.namespace AND t1.id = t2.max_id
               ) m ON e.namespace = m.namespace
+             {where}
              ORDER BY e.created_at DESC
-            """
+            """,
+            args,
         )
         for r in rows:
             r["cpu_pct"] = r.get("cpu_pct") or 0.0
@@ -447,10 +900,28 @@ class EnvironmentManager:
             r["io_read"] = r.get("io_read") or 0
             r["io_write"] = r.get("io_write") or 0
             r["process_name"] = r.get("process_name") or ""
+            r["node"] = r.get("node") or self.default_node
         return rows
 
-    def get_output_path(self, namespace):
-        return os.path.join("environments", namespace, "output.log")
+    def get_output(self, namespace):
+        """
+        output.log no nó dono do ambiente: caminho do arquivo (nó local)
+        ou resposta aberta do agente (nó remoto), para o app servir sem
+        carregar o log inteiro em memória.
+        Retorna None se o arquivo (ou o ambiente) não existir.
+        """
+        env = self.environments.get(namespace)
+        node = self.nodes[self.default_node]
+        if env:
+            node = self._node_for(env)
+        else:
+            rows = query("SELECT node FROM environments WHERE namespace=%s", (namespace,))
+            if rows and rows[0].get("node") in self.nodes:
+                node = self.nodes[rows[0]["node"]]
+        try:
+            return node.open_output(namespace)
+        except NodeError:
+            return None
 
     def terminate_environment(self, namespace):
         """
@@ -472,6 +943,7 @@ class EnvironmentManager:
                 env = Environment(
                     namespace, row["cpu"], row["memory"], row["io"], row["command"]
                 )
+                env.node = row.get("node")
                 env.unit_name = row.get("unit_name")
                 env.main_pid = row.get("last_pid") or None
 
@@ -479,59 +951,31 @@ class EnvironmentManager:
         if not env:
             return {"message": f'Ambiente "{namespace}" já não existe (nada a encerrar).'}
 
-        try:
-            if getattr(env, "unit_name", None):
-                subprocess.run(
-                    ["sudo", "systemctl", "kill", env.unit_name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
-                time.sleep(0.5)
-                subprocess.run(
-                    ["sudo", "systemctl", "kill", "--signal=SIGKILL", env.unit_name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
-                subprocess.run(
-                    ["sudo", "systemctl", "stop", env.unit_name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
-                subprocess.run(
-                    ["sudo", "systemctl", "reset-failed", env.unit_name],
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
-
-            if getattr(env, "main_pid", None):
-                try:
-                    os.kill(env.main_pid, signal.SIGTERM)
-                except (ProcessLookupError, PermissionError):
-                    pass
-
-            env.status = "terminated"
-            self._db_insert_metric(
-                env.namespace, env.status, env.main_pid or 0, 0.0, 0, 0, 0
-            )
-            execute(
-                "UPDATE environments SET last_status=%s WHERE namespace=%s",
-                ("terminated", env.namespace),
-            )
+        node = self._node_for(env)
 
-        except Exception:
-            # mesmo que dê erro pra matar, vamos continuar e responder sucesso
+        try:
+            node.kill(getattr(env, "unit_name", None), getattr(env, "main_pid", None))
+        except NodeError:
+            # agente fora do ar: marca como encerrado mesmo assim, senão o
+            # ambiente fica 'running' e segura a reserva no nó para sempre
             pass
 
+        env.status = "terminated"
+        self._db_insert_metric(
+            env.namespace, env.status, env.main_pid or 0, 0.0, 0, 0, 0
+        )
+        execute(
+            "UPDATE environments SET last_status=%s WHERE namespace=%s",
+            ("terminated", env.namespace),
+        )
+
         # tira do cache em memória
         self.environments.pop(namespace, None)
 
-        # tenta remover pasta environments/<ns>, mas não vamos falhar se der busy
-        env_path = os.path.join("environments", namespace)
+        # tenta remover pasta environments/<ns> no nó, mas não vamos falhar se der busy
         try:
-            if os.path.exists(env_path):
-                shutil.rmtree(env_path)
-        except Exception:
-            # ignorar qualquer erro ("Text file busy", permissão, etc.)
+            node.cleanup(namespace)
+        except NodeError:
             pass
 
         # retorno SEMPRE verde
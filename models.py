@@ -9,3 +9,4 @@ class Environment:
         self.process = None     
         self.unit_name = None   
         self.main_pid = None    
+        self.node = None
@@ -0,0 +1,238 @@
+import json
+import os
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import executor
+from pool import WarmPool, parse_pool_spec
+
+# /capacity, /pool e /pressure são consultados em todo /resources e /create:
+# timeout curto e, se o nó não responder, ele fica fora por DOWN_BACKOFF
+# segundos em vez de custar um timeout a cada chamada
+PROBE_TIMEOUT = 2.0
+DOWN_BACKOFF = 15.0
+
+
+class NodeError(Exception):
+    """Falha ao falar com um nó (agente fora do ar, timeout, resposta inválida)."""
+
+
+class LocalNode:
+    """
+    Nó que roda no mesmo host do manager.
+    Chama o executor diretamente, sem HTTP no meio.
+    """
+
+    def __init__(self, node_id="local", pool_spec=None):
+        self.node_id = node_id
+        self._capacity = None
+        self.pool = WarmPool(parse_pool_spec(pool_spec), node_id)
+
+    def capacity(self):
+        if self._capacity is None:
+            self._capacity = executor.host_capacity()
+        return self._capacity
+
+    def run(self, namespace, command, cpu, memory, io=1):
+        # slot quente do pool quando houver; senão, caminho frio
+        warm = self.pool.claim(namespace, command, cpu, memory, io)
+        if warm is not None:
+            return warm
+        return executor.run_command(namespace, command, cpu, memory, io)
+
+    def pool_status(self):
+        return self.pool.status()
+
+    def pressure(self):
+        return executor.host_pressure()
+
+    def resize(self, namespace, unit_name, cpu, memory, io=None):
+        return executor.resize_unit(namespace, unit_name, cpu, memory, io)
+
+    def props(self, unit_name):
+        return executor.systemd_props(unit_name)
+
+    def sample(self, pid, unit_name=None):
+        return executor.sample_process(pid, unit_name)
+
+    def kill(self, unit_name, main_pid=None):
+        executor.kill_unit(unit_name, main_pid)
+
+    def cleanup(self, namespace):
+        executor.remove_env_dir(namespace)
+
+    def open_output(self, namespace):
+        """Caminho do output.log (o app serve com send_file), ou None."""
+        path = os.path.abspath(os.path.join("environments", namespace, "output.log"))
+        return path if os.path.isfile(path) else None
+
+
+class RemoteNode:
+    """
+    Nó remoto: fala com um agent.py rodando em outro host (ou em outra
+    porta do localhost) via HTTP/JSON.
+    """
+
+    def __init__(self, node_id, base_url, timeout=10.0):
+        self.node_id = node_id
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = os.environ.get("EXECENV_AGENT_TOKEN", "")
+        self._capacity = None
+        self._down_until = 0.0
+
+    def _open(self, method, path, payload=None, timeout=None):
+        """Abre a requisição e devolve a resposta sem ler o corpo (None em 404)."""
+        data = None
+        headers = {}
+        if self.token:
+            headers["X-Agent-Token"] = self.token
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(
+            self.base_url + path, data=data, headers=headers, method=method
+        )
+        try:
+            return urllib.request.urlopen(req, timeout=timeout or self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return None
+            raise NodeError(f"{self.node_id}: HTTP {e.code} em {path}") from e
+        except (urllib.error.URLError, OSError) as e:
+            raise NodeError(f"{self.node_id}: {e}") from e
+
+    def _request(self, method, path, payload=None, timeout=None):
+        res = self._open(method, path, payload, timeout)
+        if res is None:
+            return None
+        try:
+            with res:
+                body = res.read()
+        except OSError as e:
+            raise NodeError(f"{self.node_id}: {e}") from e
+        try:
+            return json.loads(body.decode() or "{}")
+        except ValueError as e:
+            raise NodeError(f"{self.node_id}: resposta inválida em {path}") from e
+
+    def _probe(self, path):
+        """
+        GET rápido de estado do nó (capacidade, pool, pressão).
+        Resposta vazia ou falha deixam o nó marcado como fora do ar.
+        """
+        if time.monotonic() < self._down_until:
+            raise NodeError(f"{self.node_id}: fora do ar (nova tentativa em breve)")
+        try:
+            res = self._request("GET", path, timeout=PROBE_TIMEOUT)
+            if res is None:
+                raise NodeError(f"{self.node_id}: {path} não encontrado")
+        except NodeError:
+            self._down_until = time.monotonic() + DOWN_BACKOFF
+            raise
+        return res
+
+    def capacity(self):
+        # capacidade fica em cache, mas nó marcado fora do ar não a anuncia
+        if time.monotonic() < self._down_until:
+            raise NodeError(f"{self.node_id}: fora do ar (nova tentativa em breve)")
+        if self._capacity is None:
+            cap = self._probe("/capacity")
+            try:
+                self._capacity = {
+                    "cpu": float(cap["cpu"]),
+                    "memory": int(cap["memory"]),
+                    "io": int(cap.get("io") or 0),
+                }
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                self._down_until = time.monotonic() + DOWN_BACKOFF
+                raise NodeError(f"{self.node_id}: resposta inválida em /capacity") from e
+        return self._capacity
+
+    def run(self, namespace, command, cpu, memory, io=1):
+        res = self._request(
+            "POST",
+            "/run",
+            {
+                "namespace": namespace,
+                "command": command,
+                "cpu": cpu,
+                "memory": memory,
+                "io": io,
+            },
+        )
+        if not res or "unit" not in res:
+            raise NodeError(f"{self.node_id}: resposta inválida em /run")
+        return res["unit"], res.get("pid"), res["output_path"]
+
+    def pool_status(self):
+        return self._probe("/pool")
+
+    def pressure(self):
+        return self._probe("/pressure")
+
+    def resize(self, namespace, unit_name, cpu, memory, io=None):
+        res = self._request(
+            "POST",
+            "/resize",
+            {
+                "namespace": namespace,
+                "unit": unit_name,
+                "cpu": cpu,
+                "memory": memory,
+                "io": io,
+            },
+        )
+        return bool(res and res.get("ok"))
+
+    def props(self, unit_name):
+        res = self._request("GET", "/units/" + urllib.parse.quote(unit_name))
+        return res or {"LoadState": "not-found"}
+
+    def sample(self, pid, unit_name=None):
+        path = f"/sample/{int(pid or 0)}"
+        if unit_name:
+            path += "?unit=" + urllib.parse.quote(unit_name)
+        return self._request("GET", path)
+
+    def kill(self, unit_name, main_pid=None):
+        self._request("POST", "/kill", {"unit": unit_name, "pid": main_pid})
+
+    def cleanup(self, namespace):
+        self._request("POST", "/cleanup", {"namespace": namespace})
+
+    def open_output(self, namespace):
+        """Resposta do agente ainda aberta (o app repassa em blocos), ou None."""
+        return self._open("GET", "/output/" + urllib.parse.quote(namespace))
+
+
+def load_nodes():
+    """
+    Monta o registro de nós a partir de EXECENV_NODES:
+
+        EXECENV_NODES="n1=http://127.0.0.1:5101,n2=http://127.0.0.1:5102"
+
+    Sem a variável, o manager trabalha só com o host local (modo antigo).
+    Nós locais usam o pool quente descrito em EXECENV_WARM_POOL
+    (ex: "1.0:512=2,0.5:256=4"); nós remotos configuram o próprio agente.
+    """
+    pool_spec = os.environ.get("EXECENV_WARM_POOL", "")
+    spec = os.environ.get("EXECENV_NODES", "").strip()
+    if not spec:
+        return {"local": LocalNode("local", pool_spec)}
+
+    nodes = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        node_id, _, url = item.partition("=")
+        node_id = node_id.strip()
+        url = url.strip()
+        if url in ("", "local"):
+            nodes[node_id] = LocalNode(node_id, pool_spec)
+        else:
+            nodes[node_id] = RemoteNode(node_id, url)
+    return nodes
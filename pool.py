@@ -0,0 +1,272 @@
+import errno
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+import psutil
+
+import executor
+
+# intervalo (s) em que o refill confere o pool mesmo sem ninguém ter consumido
+REFILL_INTERVAL = 5.0
+# quanto o refill espera o login shell do slot chegar ao FIFO
+READY_TIMEOUT = 30.0
+
+POOL_DIR = os.path.join("environments", ".pool")
+
+# Script do slot quente. Roda como login shell (bash -lc) já dentro da unit
+# com MemoryMax/CPUQuota aplicados e fica bloqueado no FIFO ($1).
+# O FIFO é aberto em leitura+escrita (não espera escritor), e só depois o
+# marcador $2 é criado: marcador presente = FIFO já tem leitor.
+# Quem reserva o slot escreve "<output_path>\0<comando>\0"; o shell redireciona
+# stdout/stderr para o log e faz exec do comando, mantendo o mesmo PID.
+_WARM_SCRIPT = r'''
+exec 3<>"$1" || exit 1
+: > "$2"
+IFS= read -r -d '' out <&3 || exit 0
+IFS= read -r -d '' cmd <&3
+exec 3<&-
+exec >>"$out" 2>&1
+eval "exec $cmd"
+'''
+
+
+def parse_pool_spec(spec):
+    """
+    Converte "1.0:512=2,0.5:256:5=4" em {(1.0, 512, 1): 2, (0.5, 256, 5): 4},
+    ou seja, (cpu, memória MB, io) -> quantidade de slots quentes.
+    O io é opcional no perfil (padrão 1, o mesmo do /create).
+    """
+    profiles = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        profile, _, count = item.partition("=")
+        cpu, _, rest = profile.partition(":")
+        memory, _, io = rest.partition(":")
+        profiles[_profile_key(cpu, memory, io or 1)] = int(count or 1)
+    return profiles
+
+
+def _profile_key(cpu, memory, io):
+    return round(float(cpu), 2), int(memory), int(io)
+
+
+class _Slot:
+    def __init__(self, slot_id, unit_name, pid, fifo, cpu, memory, io):
+        self.slot_id = slot_id
+        self.unit_name = unit_name
+        self.pid = pid
+        self.fifo = fifo
+        self.cpu = cpu
+        self.memory = memory
+        self.io = io
+
+    def alive(self):
+        return os.path.exists(self.fifo) and psutil.pid_exists(self.pid)
+
+
+class WarmPool:
+    """
+    Pool de units pré-criadas por perfil (cpu, memória, io).
+
+    Cada slot é uma unit systemd-run já com limites, diretório e login shell
+    prontos, esperando um comando. claim() entrega o comando ao slot em
+    poucos milissegundos; uma thread de refill mantém cada perfil no tamanho
+    alvo.
+    """
+
+    def __init__(self, profiles, node_id="local"):
+        self.profiles = dict(profiles)
+        self.node_id = node_id
+        self._prefix = f"env-pool-{node_id}-"
+        self._ready = {key: [] for key in self.profiles}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    # ===== ciclo de vida =====
+    def _ensure_started(self):
+        """
+        Sobe a thread de refill no primeiro uso (não no import, para não
+        duplicar slots no processo pai do reloader do Flask).
+        """
+        if self._thread is not None or not self.profiles:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._reap_leftovers()
+            self._thread = threading.Thread(target=self._refill_loop, daemon=True)
+            self._thread.start()
+
+    def _reap_leftovers(self):
+        """
+        Mata slots ociosos que sobraram de uma execução anterior deste nó.
+
+        Slot reservado continua com o nome env-pool-* mas já é job de
+        usuário: claim() remove o FIFO dele. Então só é ocioso (e pode
+        morrer) o slot cujo environments/.pool/<nó>/<slot>/cmd ainda existe.
+        """
+        node_dir = os.path.join(POOL_DIR, self.node_id)
+        try:
+            slot_ids = os.listdir(node_dir)
+        except OSError:
+            slot_ids = []
+        for slot_id in slot_ids:
+            if os.path.exists(os.path.join(node_dir, slot_id, "cmd")):
+                executor.kill_unit(f"{self._prefix}{slot_id}.service")
+            executor.remove_env_dir(os.path.join(".pool", self.node_id, slot_id))
+
+    def _refill_loop(self):
+        while True:
+            self.refill()
+            self._wakeup.wait(REFILL_INTERVAL)
+            self._wakeup.clear()
+
+    def refill(self):
+        """Descarta slots mortos e completa cada perfil até o alvo."""
+        for key, target in self.profiles.items():
+            with self._lock:
+                self._ready[key] = [s for s in self._ready[key] if s.alive()]
+                missing = target - len(self._ready[key])
+            for _ in range(missing):
+                slot = self._spawn(*key)
+                if slot is None:
+                    break
+                with self._lock:
+                    self._ready[key].append(slot)
+
+    def _spawn(self, cpu, memory, io):
+        slot_id = uuid.uuid4().hex[:8]
+        slot_dir = os.path.abspath(os.path.join(POOL_DIR, self.node_id, slot_id))
+        os.makedirs(slot_dir, exist_ok=True)
+        fifo = os.path.join(slot_dir, "cmd")
+        ready = os.path.join(slot_dir, "ready")
+        os.mkfifo(fifo, 0o600)
+
+        unit_name = f"{self._prefix}{slot_id}.service"
+        quota_str = f"{float(cpu) * 100.0:.1f}%"
+        cmd = [
+            "sudo", "systemd-run", "--quiet",
+            "--unit", unit_name,
+            "--collect",
+            "-p", f"MemoryMax={int(memory)}M",
+            "-p", f"CPUQuota={quota_str}",
+            "-p", "KillMode=mixed",
+            "-p", "TimeoutStopSec=5s",
+        ]
+        for prop in executor.io_properties(io):
+            cmd.extend(["-p", prop])
+        cmd.extend(["/bin/bash", "-lc", _WARM_SCRIPT, "warm-slot", fifo, ready])
+        subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        # MainPID aparece antes do login profile terminar; o slot só vai
+        # para _ready quando o shell já estiver lendo o FIFO
+        pid = executor.wait_main_pid(unit_name)
+        if pid is None or not self._wait_ready(ready, pid):
+            executor.kill_unit(unit_name)
+            executor.remove_env_dir(os.path.join(".pool", self.node_id, slot_id))
+            return None
+        return _Slot(slot_id, unit_name, pid, fifo, cpu, memory, io)
+
+    @staticmethod
+    def _wait_ready(ready, pid):
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            if os.path.exists(ready):
+                return True
+            if not psutil.pid_exists(pid):
+                return False
+            time.sleep(0.05)
+        return False
+
+    def _discard(self, slot):
+        """Derruba um slot morto fora do caminho do claim (kill_unit é lento)."""
+        executor.kill_unit(slot.unit_name)
+        executor.remove_env_dir(os.path.join(".pool", self.node_id, slot.slot_id))
+
+    # ===== uso =====
+    def claim(self, namespace, command, cpu, memory, io=1):
+        """
+        Entrega o comando a um slot quente do perfil (cpu, memory, io).
+        Retorna (unit_name, main_pid, output_path) como run_command,
+        ou None se não houver slot pronto (quem chama cai no caminho frio).
+        """
+        self._ensure_started()
+        key = _profile_key(cpu, memory, io)
+        if key not in self.profiles:
+            return None
+
+        output_dir = os.path.join("environments", namespace)
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.abspath(os.path.join(output_dir, "output.log"))
+        payload = output_path.encode() + b"\0" + command.encode() + b"\0"
+
+        while True:
+            with self._lock:
+                if not self._ready[key]:
+                    return None
+                slot = self._ready[key].pop(0)
+            try:
+                # O_NONBLOCK: se o shell do slot morreu não há leitor e
+                # o open falha com ENXIO em vez de travar
+                fd = os.open(slot.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno not in (errno.ENXIO, errno.ENOENT):
+                    raise
+                threading.Thread(
+                    target=self._discard, args=(slot,), daemon=True
+                ).start()
+                continue
+            try:
+                # com o leitor garantido, volta a bloquear para escrever tudo
+                os.set_blocking(fd, True)
+                os.write(fd, payload)
+            finally:
+                os.close(fd)
+            # sem FIFO o slot deixa de ser ocioso para _reap_leftovers
+            os.unlink(slot.fifo)
+            break
+
+        self._wakeup.set()
+        threading.Thread(
+            target=self._after_claim, args=(namespace, slot), daemon=True
+        ).start()
+        return slot.unit_name, slot.pid, output_path
+
+    def _after_claim(self, namespace, slot):
+        # espelho do cgroup e limpeza do diretório ficam fora do caminho crítico
+        executor.mirror_cgroup_limits(namespace, slot.cpu, slot.memory, slot.io)
+        executor.remove_env_dir(os.path.join(".pool", self.node_id, slot.slot_id))
+
+    def status(self):
+        """
+        Situação do pool para /resources: por perfil, alvo e slots prontos,
+        e a capacidade que os slots prontos deixam reservada (limites já
+        aplicados, mas ainda sem job rodando).
+        """
+        self._ensure_started()
+        profiles = []
+        reserved_cpu = 0.0
+        reserved_mem = 0
+        with self._lock:
+            for (cpu, memory, io), target in self.profiles.items():
+                ready = len(self._ready[(cpu, memory, io)])
+                profiles.append({
+                    "cpu": cpu,
+                    "memory": memory,
+                    "io": io,
+                    "target": target,
+                    "ready": ready,
+                })
+                reserved_cpu += cpu * ready
+                reserved_mem += memory * ready
+        return {
+            "profiles": profiles,
+            "reserved_cpu": reserved_cpu,
+            "reserved_memory": reserved_mem,
+        }